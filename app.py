@@ -1,59 +1,176 @@
 # app.py — SOLO CARGA DE GASTOS (Mongo, obra manual, formato ARS)
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
-from decimal import Decimal, InvalidOperation
+import pymongo
 import streamlit as st
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo.errors import PyMongoError
+from pymongo import MongoClient, IndexModel, ASCENDING, DESCENDING
+from pymongo.errors import (BulkWriteError, ExecutionTimeout, NetworkTimeout,
+                            PyMongoError, WriteError)
+from pymongo.write_concern import WriteConcern
 
 st.set_page_config(page_title="Cargar Gastos", page_icon="💼", layout="centered")
 
 # ---- Config DB ----
-MONGO_URI = st.secrets.get("MONGO_URI", os.getenv("MONGO_URI", ""))
-MONGO_DB_NAME = st.secrets.get("MONGO_DB", os.getenv("MONGO_DB", "tus_gastos_db"))
-GASTOS_COLL_NAME = st.secrets.get("MONGO_GASTOS_COLL", os.getenv("MONGO_GASTOS_COLL", "gastos"))
+# se lee recién dentro de los cache_resource: Streamlit re-ejecuta el módulo en cada rerun
+def _cfg(key: str, default: str = "") -> str:
+    return st.secrets.get(key, os.getenv(key, default))
 
-@st.cache_resource(show_spinner=False)
-def get_coll():
-    if not MONGO_URI:
-        raise RuntimeError("MONGO_URI no configurado en .streamlit/secrets.toml o variables de entorno.")
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    client.admin.command("ping")
-    coll = client[MONGO_DB_NAME][GASTOS_COLL_NAME]
-    # índices útiles para tus otras pantallas
+# índices útiles para tus otras pantallas
+GASTOS_INDEXES = [
+    ("idx_estado_fecha", [("estado", ASCENDING), ("fecha", DESCENDING)]),
+    ("idx_obra", [("obra", ASCENDING)]),
+    ("idx_comprobante", [("comprobante", ASCENDING)]),
+]
+
+def _ensure_indexes(coll) -> None:
+    """Crea los índices en un único createIndexes (idempotente si ya existen)."""
     try:
-        coll.create_index([("estado", ASCENDING), ("fecha", DESCENDING)], name="idx_estado_fecha")
-        coll.create_index([("obra", ASCENDING)], name="idx_obra")
-        coll.create_index([("comprobante", ASCENDING)], name="idx_comprobante")
+        coll.create_indexes([IndexModel(keys, name=name) for name, keys in GASTOS_INDEXES])
     except Exception:
         pass
+
+@st.cache_resource(show_spinner=False)
+def get_client() -> MongoClient:
+    """Un único MongoClient por proceso, compartido por todas las colecciones."""
+    mongo_uri = _cfg("MONGO_URI")
+    if not mongo_uri:
+        raise RuntimeError("MONGO_URI no configurado en .streamlit/secrets.toml o variables de entorno.")
+    # sin socketTimeoutMS global: cortaría también el createIndexes de _ensure_indexes;
+    # el límite de tiempo va solo en el guardado del form (ver _guardar_gasto_bg)
+    # minPoolSize=1 mantiene un socket ya autenticado entre períodos sin uso
+    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000,
+                         connectTimeoutMS=5000,
+                         maxPoolSize=8, minPoolSize=1,
+                         compressors="zstd,zlib", retryWrites=True)
+    client.admin.command("ping")
+    return client
+
+@st.cache_resource(show_spinner=False)
+def get_coll():
+    # w=1: ack del primario alcanza para la carga (queda "pendiente" de aprobación);
+    # escrituras más críticas pueden seguir usando el write concern por defecto
+    coll = get_client()[_cfg("MONGO_DB", "tus_gastos_db")].get_collection(
+        _cfg("MONGO_GASTOS_COLL", "gastos"), write_concern=WriteConcern(w=1))
+    _ensure_indexes(coll)
     return coll
 
 def _to_datetime(fecha_date: date) -> datetime:
     return datetime(fecha_date.year, fecha_date.month, fecha_date.day)
 
+_ARS_TABLE = str.maketrans({",": ".", ".": ","})
+
 def format_monto(monto):
     """Mostrar como $ 1.234,56 (solo en UI)."""
     try:
         val = float(monto)
-        return f"$ {val:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        return "$ " + f"{val:,.2f}".translate(_ARS_TABLE)
     except Exception:
         return f"$ {monto}"
 
+def _insert_docs(coll, docs: list[dict], ordered: bool = True) -> None:
+    """Insert sin st.* (se usa también desde el executor). Propaga PyMongoError."""
+    if len(docs) == 1:
+        coll.insert_one(docs[0])
+    else:
+        coll.insert_many(docs, ordered=ordered)
+
+BULK_CHUNK = 500
+
+def insertar_gastos(docs: list[dict]) -> bool:
+    """Inserta varios gastos en Mongo (carga masiva). Devuelve True/False.
+
+    Va en tandas de BULK_CHUNK para poder contar lo ya guardado si algo falla a mitad.
+    ordered=False: el server sigue con el resto de la tanda aunque falle un documento.
+    """
+    if not docs:
+        return True
+    n_ok, n_rechazados = 0, 0
+    try:
+        coll = get_coll()
+        for i in range(0, len(docs), BULK_CHUNK):
+            tanda = docs[i:i + BULK_CHUNK]
+            try:
+                _insert_docs(coll, tanda, ordered=False)
+                n_ok += len(tanda)
+            except BulkWriteError as e:
+                n_ok += e.details.get("nInserted", 0)
+                n_rechazados += len(e.details.get("writeErrors", []))
+            except WriteError:
+                n_rechazados += 1           # tanda de un solo doc (insert_one)
+    except PyMongoError as e:
+        # timeout/red a mitad de una tanda: esa tanda puede haber quedado a medias
+        st.error(f"❌ Error insertando en MongoDB: {e}. Se guardaron al menos {n_ok} de "
+                 f"{len(docs)} gastos; parte del resto puede haberse guardado. "
+                 "Revisá antes de reimportar para no duplicar.")
+        return False
+    if n_rechazados:
+        st.error(f"❌ Se guardaron {n_ok} de {len(docs)} gastos. Errores: {n_rechazados}")
+        return False
+    return True
+
+INSERT_TIMEOUT_S = 15
+
+def _guardar_gasto_bg(coll, doc: dict) -> None:
+    """Tarea del executor para el form: un socket colgado falla en segundos, no minutos.
+
+    El deadline de pymongo.timeout es para todo el bloque, por eso va solo acá
+    (un gasto) y no en _insert_docs, que también usa la carga masiva.
+    """
+    with pymongo.timeout(INSERT_TIMEOUT_S):
+        _insert_docs(coll, [doc])
+
+@st.cache_resource(show_spinner=False)
+def get_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="insert_gasto")
+
 def insertar_gasto(doc: dict) -> bool:
-    """Inserta el gasto en Mongo. Devuelve True/False."""
+    """Encola el insert del gasto en segundo plano. Devuelve False si no hay conexión.
+
+    El resultado se revisa en los próximos reruns (ver revisar_inserts_pendientes).
+    """
     try:
         coll = get_coll()
-        coll.insert_one(doc)
-        return True
     except PyMongoError as e:
-        st.error(f"❌ Error insertando en MongoDB: {e}")
+        st.error(f"❌ Error conectando a MongoDB: {e}")
         return False
+    # resumen para poder decir *cuál* gasto falló (el aviso llega después del flash)
+    resumen = (f"comprobante {doc.get('comprobante', '')} · obra {doc.get('obra', '')} · "
+               f"{format_monto(doc.get('monto', 0))}")
+    fut = get_executor().submit(_guardar_gasto_bg, coll, doc)
+    st.session_state.insert_futures.append((fut, resumen))
+    return True
+
+def revisar_inserts_pendientes():
+    """Avisa cada insert en segundo plano que terminó con error (el flash fue optimista)."""
+    pendientes = []
+    for fut, resumen in st.session_state.insert_futures:
+        if not fut.done():
+            pendientes.append((fut, resumen))
+            continue
+        err = fut.exception()
+        if isinstance(err, (NetworkTimeout, ExecutionTimeout)):
+            # venció el deadline: el server pudo haber aplicado el insert igual
+            st.warning(f"⚠️ No se pudo confirmar si el gasto ({resumen}) se guardó "
+                       f"(timeout: {err}). Revisá antes de volver a cargarlo para no duplicarlo.")
+        elif err is not None:
+            st.error(f"❌ El gasto ({resumen}) NO se guardó en MongoDB: {err}")
+    st.session_state.insert_futures = pendientes
+
+# ---- Estado de sesión ----
+for _k, _v in (("insert_futures", []), ("flash_ok", None)):
+    st.session_state.setdefault(_k, _v)
 
 # ---- UI: SOLO carga ----
 st.title("💼 Carga de gastos")
 
+revisar_inserts_pendientes()
+if st.session_state.flash_ok:
+    st.success(st.session_state.flash_ok)
+    st.session_state.flash_ok = None
+    st.balloons()
+
 with st.form("form_gasto", clear_on_submit=False):
     col_a, col_b = st.columns(2)
     with col_a:
@@ -77,13 +194,14 @@ with st.form("form_gasto", clear_on_submit=False):
 
 # Validaciones mínimas y confirmación
 if submit:
+    # monto en centavos enteros (el input ya viene con step=0.01)
     try:
-        monto_dec = Decimal(str(monto_input)).quantize(Decimal("0.01"))
-    except (InvalidOperation, ValueError):
-        monto_dec = Decimal("0.00")
+        monto_cents = int(round(float(monto_input) * 100))
+    except (TypeError, ValueError):
+        monto_cents = 0
 
     errores = []
-    if monto_dec <= Decimal("0.00"):
+    if monto_cents <= 0:
         errores.append("El monto debe ser mayor a 0.")
     if not (obra or "").strip():
         errores.append("Ingresá el nombre de la obra.")
@@ -101,7 +219,7 @@ if submit:
             st.write("Revisá y confirmá los datos del gasto:")
             st.info(f"**📅 Fecha:** {fecha.strftime('%d/%m/%Y')}")
             st.info(f"**📝 Concepto:** {concepto.strip()}")
-            st.info(f"**💵 Monto:** {format_monto(monto_dec)}")
+            st.info(f"**💵 Monto:** {format_monto(monto_cents / 100)}")
             st.info(f"**🏗️ Obra:** {obra.strip()}")
             st.info(f"**📄 Comprobante Nº:** {comprobante.strip()}")
             st.info(f"**🏪 Proveedor:** {(proveedor or '').strip()}")
@@ -117,7 +235,7 @@ if submit:
                     doc = {
                         "fecha": _to_datetime(fecha),
                         "concepto": concepto.strip(),
-                        "monto": float(monto_dec),          # número en DB
+                        "monto": monto_cents / 100,         # número en DB
                         "comprobante": comprobante.strip(),
                         "obra": obra.strip(),               # obra como texto
                         "persona": (persona or "").strip(),
@@ -126,8 +244,8 @@ if submit:
                         "estado": "pendiente",              # para tu vista de aprobación
                     }
                     if insertar_gasto(doc):
-                        st.success("✅ ¡Gasto guardado con éxito!")
-                        st.balloons()
+                        st.session_state.flash_ok = "✅ ¡Gasto guardado con éxito!"
+                        st.rerun()
 
         if hasattr(st, "dialog"):
             @st.dialog("Confirmar carga")